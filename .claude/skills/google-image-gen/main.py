@@ -9,7 +9,8 @@ This script is part of the google-image-gen Claude Code skill.
 Setup:
     1. Get API key from https://aistudio.google.com/apikey
     2. Create .env file in skill directory with: GOOGLE_AI_API_KEY=your_key_here
-    3. Run: uv sync (or pip install google-genai python-dotenv pillow)
+       (optionally GOOGLE_AI_API_KEYS=key1,key2 to add keys for batches)
+    3. Run: uv sync (or pip install google-genai python-dotenv tenacity)
 
 Usage:
     # Generate from prompt
@@ -30,19 +31,145 @@ Usage:
     # Specify aspect ratio
     uv run python main.py output.png "Prompt" --aspect 16:9
 
+    # Limit how many variations are generated in parallel
+    uv run python main.py output.png "cube" "sphere" "pyramid" --concurrency 2
+
 Aspect ratios: 1:1, 3:4, 4:3, 4:5, 5:4, 9:16, 16:9, 21:9
 """
+from __future__ import annotations
+
 import argparse
+import asyncio
+import hashlib
+import mimetypes
 import os
 import re
 import sys
+import tempfile
+from collections.abc import AsyncGenerator, Generator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, closing
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from PIL import Image
+from tenacity import (
+    RetryCallState,
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+# google.genai pulls in a large dependency tree, so it is imported where
+# used to keep --help and configuration errors fast
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
+
+MODEL = "gemini-3-pro-image-preview"
+
+# Leading bytes of the image formats the API returns
+IMAGE_SIGNATURES = (
+    b"\x89PNG\r\n\x1a\n",  # PNG
+    b"\xff\xd8\xff",  # JPEG
+)
+
+# Local cache of generated images, keyed by request content
+OUTPUT_CACHE_DIR = Path(
+    os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+) / "google-image-gen"
+
+# Explicit context caching needs a prefix of at least this many tokens
+CACHE_MIN_TOKENS = 2048
+CACHE_TTL = "600s"
+
+# How long idle pooled connections stay open. httpx defaults to 5s, which
+# drops the connection between slow requests and forces a new TLS handshake.
+KEEPALIVE_EXPIRY = 120.0
+
+# HTTP status codes worth retrying: rate limits, timeouts and server errors
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Longest wait between retries, including server-requested Retry-After
+MAX_RETRY_WAIT = 60
+
+# Subject placeholder variants, normalized to {subject}
+_PLACEHOLDER_RE = re.compile(
+    r'\[YOUR SUBJECT[^\]]*\]|\[SUBJECT\]|\{subject\}',
+    re.IGNORECASE,
+)
+
+
+def _skip_whitespace(text: str, pos: int) -> int:
+    """Return the first index at or after pos that is not whitespace."""
+    while pos < len(text) and text[pos].isspace():
+        pos += 1
+    return pos
+
+
+def _find_template_header(lowered: str) -> int:
+    """Find the end of the first template header in lowercased content.
+
+    Accepts one or two '#', optional whitespace, an optional "prompt"
+    and optional whitespace before "template", so "## Prompt Template",
+    "### Template", "#  Template" and "##PromptTemplate" all match.
+
+    Args:
+        lowered: Lowercased markdown content of a style file.
+
+    Returns:
+        Index just past the header's "template", or -1 if there is none.
+    """
+    hash_pos = lowered.find("#")
+    while hash_pos != -1:
+        pos = hash_pos + 1
+        if lowered.startswith("#", pos):
+            pos += 1
+        pos = _skip_whitespace(lowered, pos)
+        if lowered.startswith("prompt", pos):
+            after_prompt = _skip_whitespace(lowered, pos + len("prompt"))
+            if lowered.startswith("template", after_prompt):
+                return after_prompt + len("template")
+        if lowered.startswith("template", pos):
+            return pos + len("template")
+        hash_pos = lowered.find("#", hash_pos + 1)
+    return -1
+
+
+def _find_template_block(content: str) -> Optional[str]:
+    """Find the first code block after a template header.
+
+    A forward scan with str.find, so parsing stays linear in the size of
+    the file.
+
+    Args:
+        content: Markdown content of a style file.
+
+    Returns:
+        The raw code block body, or None if there is no template block.
+    """
+    header = _find_template_header(content.lower())
+    if header == -1:
+        return None
+
+    header_end = content.find("\n", header)
+    if header_end == -1:
+        return None
+    # The opening fence must start a line after the header
+    open_fence = content.find("```", header_end)
+    while open_fence != -1 and content[open_fence - 1] != "\n":
+        open_fence = content.find("```", open_fence + 3)
+    if open_fence == -1:
+        return None
+    body_start = content.find("\n", open_fence)
+    if body_start == -1:
+        return None
+    close_fence = content.find("```", body_start)
+    if close_fence == -1:
+        return None
+    return content[body_start + 1:close_fence]
 
 
 def load_style_template(style_path: Path) -> str:
@@ -66,22 +193,10 @@ def load_style_template(style_path: Path) -> str:
 
     content = style_path.read_text()
 
-    # Look for code block after "Prompt Template" or "Template" header
-    pattern = (
-        r'(?:##?\s*(?:Prompt\s*)?Template)[^\n]*\n+(?:.*?\n)*?```[^\n]*\n(.*?)```'
-    )
-    match = re.search(pattern, content, re.IGNORECASE | re.DOTALL)
-
-    if match:
-        template = match.group(1).strip()
+    template = _find_template_block(content)
+    if template is not None:
         # Normalize the placeholder
-        template = re.sub(
-            r'\[YOUR SUBJECT[^\]]*\]|\[SUBJECT\]|\{subject\}',
-            '{subject}',
-            template,
-            flags=re.IGNORECASE
-        )
-        return template
+        return _PLACEHOLDER_RE.sub('{subject}', template.strip())
 
     raise ValueError(
         f"No prompt template found in {style_path}. "
@@ -89,6 +204,72 @@ def load_style_template(style_path: Path) -> str:
     )
 
 
+@lru_cache(maxsize=None)
+def _read_image_part(path: str, mtime_ns: int) -> types.Part:
+    """Read an image file into a part once per (path, mtime) pair."""
+    from google.genai import types
+
+    data = Path(path).read_bytes()
+    mime_type = mimetypes.guess_type(path)[0] or "image/png"
+    return types.Part(inline_data=types.Blob(data=data, mime_type=mime_type))
+
+
+def image_part(path: Path) -> types.Part:
+    """Wrap an image file's raw bytes as a request part.
+
+    The encoded file is sent as-is instead of being decoded and
+    re-encoded through PIL. Parts are cached, so every request and cache
+    key that uses the same unchanged file shares a single Blob.
+
+    Args:
+        path: Path to the image file.
+
+    Returns:
+        An inline-data part with the file's bytes and MIME type.
+
+    Raises:
+        FileNotFoundError: If the image file doesn't exist.
+    """
+    return _read_image_part(str(path), path.stat().st_mtime_ns)
+
+
+def _try_load_image_part(path: Path) -> Optional[types.Part]:
+    """Load an image part, or return None if the file does not exist."""
+    try:
+        return image_part(path)
+    except FileNotFoundError:
+        return None
+
+
+def load_reference_images(paths: list[Path]) -> list[types.Part]:
+    """Load reference images so they can be shared across requests.
+
+    Files are read concurrently, since up to 14 references may sit on slow
+    or network storage. Each file is read once and the same parts are
+    reused for every prompt in a batch. Missing files are skipped with a
+    warning.
+
+    Args:
+        paths: Paths to the reference images.
+
+    Returns:
+        The loaded images, in order.
+    """
+    if not paths:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(8, len(paths))) as ex:
+        loaded = list(ex.map(_try_load_image_part, paths))
+
+    images = []
+    for path, image in zip(paths, loaded):
+        if image is None:
+            print(f"Warning: Reference image not found: {path}")
+        else:
+            images.append(image)
+    return images
+
+
 def apply_style_template(template: str, subject: str) -> str:
     """Apply a subject to a style template.
 
@@ -105,145 +286,689 @@ def apply_style_template(template: str, subject: str) -> str:
     return f"{subject}. {template}"
 
 
+def get_api_keys() -> list[str]:
+    """Read the API keys to use from the environment.
+
+    GOOGLE_AI_API_KEY comes first, followed by any comma-separated keys
+    in GOOGLE_AI_API_KEYS, so batches can be spread across all of them.
+    Duplicates are dropped.
+
+    Returns:
+        The configured API keys, possibly empty.
+    """
+    keys = [os.environ.get("GOOGLE_AI_API_KEY", "")]
+    keys += os.environ.get("GOOGLE_AI_API_KEYS", "").split(",")
+    return list(dict.fromkeys(k.strip() for k in keys if k.strip()))
+
+
+def create_client(api_key: str, max_connections: int) -> genai.Client:
+    """Create a Gemini API client with long-lived pooled connections.
+
+    The sync and async transports are created here so their keep-alive
+    settings apply, letting a whole batch reuse the same connections.
+
+    Args:
+        api_key: Google AI API key.
+        max_connections: Connections to keep alive, usually the batch
+            concurrency.
+
+    Returns:
+        The configured client.
+    """
+    import httpx
+    from google import genai
+    from google.genai import types
+
+    limits = httpx.Limits(
+        max_keepalive_connections=max(1, max_connections),
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            httpx_client=httpx.Client(limits=limits),
+            httpx_async_client=httpx.AsyncClient(limits=limits),
+        ),
+    )
+
+
+def _is_transient_error(exc: BaseException) -> bool:
+    """Check whether an API call failure is worth retrying.
+
+    Args:
+        exc: The exception raised by the API call.
+
+    Returns:
+        True for rate limits, server errors and network failures. Invalid
+        requests and auth errors are never retried.
+    """
+    import httpx
+    from google.genai import errors
+
+    if isinstance(exc, errors.APIError):
+        return exc.code in RETRYABLE_STATUS_CODES
+    return isinstance(exc, httpx.TransportError)
+
+
+def _retry_after(exc: Optional[BaseException]) -> Optional[float]:
+    """Read the Retry-After header (in seconds) from a failed API call.
+
+    Args:
+        exc: The exception raised by the API call.
+
+    Returns:
+        The requested delay in seconds, or None if not present.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+_backoff = wait_random_exponential(multiplier=2, max=MAX_RETRY_WAIT)
+
+
+def _wait_for_retry(retry_state: RetryCallState) -> float:
+    """Wait with jittered exponential backoff, honoring Retry-After.
+
+    Retry-After is capped at MAX_RETRY_WAIT so a server asking for a long
+    pause can't stall a batch worker for hours.
+    """
+    delay = _backoff(retry_state)
+    exc = retry_state.outcome.exception() if retry_state.outcome else None
+    retry_after = _retry_after(exc)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, MAX_RETRY_WAIT))
+    return delay
+
+
+def _log_retry(retry_state: RetryCallState) -> None:
+    """Report a transient failure before sleeping."""
+    exc = retry_state.outcome.exception() if retry_state.outcome else None
+    print(f"Transient API error ({exc}), retrying in "
+          f"{retry_state.next_action.sleep:.1f}s "
+          f"(attempt {retry_state.attempt_number})...")
+
+
+_retry_transient = retry(
+    retry=retry_if_exception(_is_transient_error),
+    wait=_wait_for_retry,
+    stop=stop_after_attempt(5),
+    before_sleep=_log_retry,
+    reraise=True,
+)
+
+
+@_retry_transient
+def _generate_content(
+    client: genai.Client,
+    contents: list,
+    config: types.GenerateContentConfig,
+) -> Generator[types.GenerateContentResponse, None, None]:
+    """Start a streaming Gemini API call, retrying transient failures.
+
+    The first chunk is fetched inside the retry, which covers rate limits
+    and connection errors; the rest of the stream is consumed lazily by
+    the caller so each chunk can be written as soon as it arrives.
+
+    Args:
+        client: Shared Gemini API client.
+        contents: Request contents (prompt and images).
+        config: Generation config.
+
+    Returns:
+        Generator over the response chunks. Closing it closes the stream.
+    """
+    stream = client.models.generate_content_stream(
+        model=MODEL,
+        contents=contents,
+        config=config,
+    )
+    first = next(stream, None)
+
+    def chunks() -> Generator[types.GenerateContentResponse, None, None]:
+        try:
+            if first is not None:
+                yield first
+                yield from stream
+        finally:
+            stream.close()
+
+    return chunks()
+
+
+@_retry_transient
+async def _agenerate_content(
+    client: genai.Client,
+    contents: list,
+    config: types.GenerateContentConfig,
+) -> AsyncGenerator[types.GenerateContentResponse, None]:
+    """Async version of _generate_content using the client's aio interface."""
+    stream = await client.aio.models.generate_content_stream(
+        model=MODEL,
+        contents=contents,
+        config=config,
+    )
+    try:
+        first = await anext(stream)
+    except StopAsyncIteration:
+        first = None
+
+    async def chunks() -> AsyncGenerator[types.GenerateContentResponse, None]:
+        try:
+            if first is not None:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+        finally:
+            await stream.aclose()
+
+    return chunks()
+
+
+def create_style_cache(
+    client: genai.Client,
+    template: str,
+) -> Optional[types.CachedContent]:
+    """Cache the invariant prefix of a style template on the server.
+
+    Everything before the {subject} placeholder is identical across a
+    batch, so it is uploaded once as cached content and each request only
+    sends the subject and the rest of the template.
+
+    Args:
+        client: Shared Gemini API client.
+        template: The prompt template with {subject} placeholder.
+
+    Returns:
+        The cached content, or None if the prefix is too short to cache or
+        the model does not support caching.
+    """
+    import httpx
+    from google.genai import errors, types
+
+    if '{subject}' not in template:
+        return None
+    prefix = template.partition('{subject}')[0].format()
+    # Rough estimate (~4 characters per token) to skip a doomed request
+    if len(prefix) // 4 < CACHE_MIN_TOKENS:
+        return None
+
+    try:
+        return client.caches.create(
+            model=MODEL,
+            config=types.CreateCachedContentConfig(
+                contents=[prefix],
+                ttl=CACHE_TTL,
+            ),
+        )
+    except (errors.APIError, httpx.TransportError) as e:
+        print(f"Warning: Style template caching unavailable ({e})")
+        return None
+
+
+def apply_cached_style_template(template: str, subject: str) -> str:
+    """Apply a subject to the uncached tail of a style template.
+
+    Args:
+        template: The prompt template with {subject} placeholder.
+        subject: The subject to insert.
+
+    Returns:
+        The prompt to send after the cached prefix from create_style_cache.
+    """
+    tail = template.partition('{subject}')[2]
+    return ('{subject}' + tail).format(subject=subject)
+
+
+def _is_image_data(data: bytes) -> bool:
+    """Check that data starts with a PNG, JPEG or WEBP signature."""
+    if data.startswith(IMAGE_SIGNATURES):
+        return True
+    return data[:4] == b"RIFF" and data[8:12] == b"WEBP"
+
+
+@lru_cache(maxsize=None)
+def _new_file_mode() -> int:
+    """Return the permissions a newly created file gets under the umask."""
+    # Linux exposes the umask without having to change it
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("Umask:"):
+                return 0o666 & ~int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def _save_image_bytes(data: bytes, output_path: Path) -> bool:
+    """Atomically save image data to disk.
+
+    The data is written to a uniquely named temporary file next to
+    output_path and then renamed over it, so output_path never holds a
+    partially written image, even with several writers to the same path.
+
+    Args:
+        data: Encoded image bytes from the API.
+        output_path: Where to save the image.
+
+    Returns:
+        True if the image was saved, False if data is not a known image.
+    """
+    if not _is_image_data(data):
+        print(f"Error: Response for {output_path} is not a valid image")
+        return False
+
+    fd, tmp_name = tempfile.mkstemp(
+        dir=output_path.parent,
+        prefix=f".{output_path.name}.",
+        suffix=".tmp",
+    )
+    tmp_path = Path(tmp_name)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # mkstemp creates the file as 0600; give it normal permissions.
+        # Windows has no POSIX modes, so leave the file as created there.
+        if os.name != "nt":
+            os.chmod(tmp_path, _new_file_mode())
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return True
+
+
+def images_digest(images: Optional[list[types.Part]]) -> bytes:
+    """Hash a set of images for use in output cache keys.
+
+    Computed once per run so a batch doesn't rehash every reference image
+    for every prompt. Order is ignored.
+
+    Args:
+        images: Optional list of loaded images.
+
+    Returns:
+        Combined digest of the image bytes.
+    """
+    digests = sorted(
+        hashlib.blake2b(image.inline_data.data).digest()
+        for image in images or []
+    )
+    return hashlib.blake2b(b"".join(digests)).digest()
+
+
+def output_cache_key(
+    prompt: str,
+    aspect_ratio: str,
+    references_digest: bytes = b"",
+    input_image: Optional[types.Part] = None,
+) -> str:
+    """Compute the local cache key for a generation request.
+
+    Args:
+        prompt: The full prompt sent to the model.
+        aspect_ratio: Aspect ratio for the image.
+        references_digest: images_digest() of the reference images.
+        input_image: The image being edited, for edit requests.
+
+    Returns:
+        Hex digest identifying the request.
+    """
+    key = hashlib.blake2b()
+    for field in (MODEL, prompt, aspect_ratio):
+        key.update(field.encode())
+        key.update(b"\0")
+    if input_image is not None:
+        key.update(b"edit\0")
+        key.update(hashlib.blake2b(input_image.inline_data.data).digest())
+    key.update(references_digest)
+    return key.hexdigest()
+
+
+def load_cached_output(key: str, output_path: Path) -> bool:
+    """Copy a previously generated image for key to output_path.
+
+    Args:
+        key: Cache key from output_cache_key.
+        output_path: Where to save the image.
+
+    Returns:
+        True if a cached image was found and saved, False otherwise.
+    """
+    cached_path = OUTPUT_CACHE_DIR / f"{key}.png"
+    try:
+        if not cached_path.exists():
+            return False
+        if not _save_image_bytes(cached_path.read_bytes(), output_path):
+            return False
+    except OSError as e:
+        # The cache is only an optimization; fall back to the API
+        print(f"Warning: Could not read image cache ({e})")
+        return False
+    print(f"Cached image saved to: {output_path}")
+    return True
+
+
+def store_cached_output(key: str, output_path: Path) -> None:
+    """Remember a generated image so identical requests can reuse it.
+
+    Args:
+        key: Cache key from output_cache_key.
+        output_path: The freshly generated image.
+    """
+    cached_path = OUTPUT_CACHE_DIR / f"{key}.png"
+    try:
+        OUTPUT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _save_image_bytes(output_path.read_bytes(), cached_path)
+    except OSError as e:
+        # The image itself is already saved, so don't fail the run
+        print(f"Warning: Could not write image cache ({e})")
+
+
+def _response_modalities(verbose: bool) -> list[str]:
+    """Request text alongside the image only when it will be shown."""
+    return ["IMAGE", "TEXT"] if verbose else ["IMAGE"]
+
+
+def _first_image_data(
+    chunk: types.GenerateContentResponse,
+) -> Optional[bytes]:
+    """Extract the first image in a response chunk.
+
+    Any text parts seen before the image are printed.
+
+    Args:
+        chunk: A streamed response chunk.
+
+    Returns:
+        The encoded image bytes, or None if the chunk has no image.
+    """
+    if not (chunk.candidates
+            and chunk.candidates[0].content
+            and chunk.candidates[0].content.parts):
+        return None
+
+    for part in chunk.candidates[0].content.parts:
+        if part.inline_data and part.inline_data.data:
+            return part.inline_data.data
+        if hasattr(part, "text") and part.text:
+            print(part.text)
+
+    return None
+
+
+def _write_first_image(
+    chunk: types.GenerateContentResponse,
+    output_path: Path,
+    label: str = "Image",
+) -> bool:
+    """Write the first image in a response chunk to disk.
+
+    Args:
+        chunk: A streamed response chunk.
+        output_path: Where to save the image.
+        label: What to call the image in the saved message.
+
+    Returns:
+        True if an image was written, False otherwise.
+    """
+    data = _first_image_data(chunk)
+    if data is None or not _save_image_bytes(data, output_path):
+        return False
+    print(f"{label} saved to: {output_path}")
+    return True
+
+
+def _save_stream(
+    chunks: Generator[types.GenerateContentResponse, None, None],
+    output_path: Path,
+    label: str = "Image",
+) -> bool:
+    """Save the first image from a streamed response.
+
+    The rest of the stream is drained after saving so the connection goes
+    back to the pool instead of being dropped with unread data.
+
+    Args:
+        chunks: Response chunks from _generate_content.
+        output_path: Where to save the image.
+        label: What to call the image in the saved message.
+
+    Returns:
+        True if image was saved successfully, False otherwise.
+    """
+    saved = False
+    with closing(chunks):
+        for chunk in chunks:
+            if not saved:
+                saved = _write_first_image(chunk, output_path, label)
+    return saved
+
+
 def edit_image(
+    client: genai.Client,
     input_path: Path,
     prompt: str,
     output_path: Path,
-    reference_images: Optional[list[Path]] = None,
+    reference_images: Optional[list[types.Part]] = None,
+    verbose: bool = False,
 ) -> bool:
     """Edit an existing image based on a text prompt.
 
     Args:
+        client: Shared Gemini API client.
         input_path: Path to the image to edit.
         prompt: Text description of the edit to make.
         output_path: Where to save the edited image.
-        reference_images: Optional list of additional reference images.
+        reference_images: Optional additional loaded reference images.
+        verbose: Also request and print the model's text response.
 
     Returns:
         True if image was saved successfully, False otherwise.
     """
-    client = genai.Client(
-        api_key=os.environ.get("GOOGLE_AI_API_KEY"),
-    )
+    from google.genai import types
 
-    contents: list = [prompt]
-    main_image = Image.open(input_path)
-    contents.append(main_image)
+    contents: list = [prompt, image_part(input_path)]
 
     if reference_images:
-        for ref_path in reference_images[:13]:  # 13 refs + 1 main = 14 max
-            if ref_path.exists():
-                contents.append(Image.open(ref_path))
-            else:
-                print(f"Warning: Reference image not found: {ref_path}")
-
-    response = client.models.generate_content(
-        model="gemini-3-pro-image-preview",
-        contents=contents,
-        config=types.GenerateContentConfig(
-            response_modalities=["IMAGE", "TEXT"],
-        ),
+        contents.extend(reference_images[:13])  # 13 refs + 1 main = 14 max
+
+    config = types.GenerateContentConfig(
+        response_modalities=_response_modalities(verbose),
     )
+    chunks = _generate_content(client, contents, config)
+    return _save_stream(chunks, output_path, label="Edited image")
 
-    if (response.candidates
-            and response.candidates[0].content
-            and response.candidates[0].content.parts):
-        for part in response.candidates[0].content.parts:
-            if part.inline_data and part.inline_data.data:
-                with open(output_path, "wb") as f:
-                    f.write(part.inline_data.data)
-                print(f"Edited image saved to: {output_path}")
-                return True
-            if hasattr(part, "text") and part.text:
-                print(part.text)
 
-    return False
+def _build_generate_request(
+    prompt: str,
+    reference_images: Optional[list[types.Part]],
+    aspect_ratio: str,
+    cached_content: Optional[str] = None,
+    verbose: bool = False,
+) -> tuple[list, types.GenerateContentConfig]:
+    """Build the request for a new image.
+
+    Args:
+        prompt: Text description of the image to generate.
+        reference_images: Optional list of loaded reference images.
+        aspect_ratio: Aspect ratio for the image.
+        cached_content: Optional name of cached content to prepend.
+        verbose: Also request the model's text response.
+
+    Returns:
+        Tuple of (contents, config) for _generate_content.
+    """
+    from google.genai import types
+
+    if reference_images:
+        contents: list = [prompt, *reference_images[:14]]
+
+        config = types.GenerateContentConfig(
+            response_modalities=_response_modalities(verbose),
+            cached_content=cached_content,
+        )
+        return contents, config
+
+    contents = [
+        types.Content(
+            role="user",
+            parts=[types.Part.from_text(text=prompt)],
+        ),
+    ]
+
+    config = types.GenerateContentConfig(
+        response_modalities=_response_modalities(verbose),
+        image_config=types.ImageConfig(
+            aspect_ratio=aspect_ratio,
+            image_size="1K",
+        ),
+        cached_content=cached_content,
+    )
+    return contents, config
 
 
 def generate_image(
+    client: genai.Client,
     prompt: str,
     output_path: Path,
-    reference_images: Optional[list[Path]] = None,
+    reference_images: Optional[list[types.Part]] = None,
     aspect_ratio: str = "16:9",
+    cached_content: Optional[str] = None,
+    verbose: bool = False,
 ) -> bool:
     """Generate a new image from a text prompt.
 
     Args:
+        client: Shared Gemini API client.
         prompt: Text description of the image to generate.
         output_path: Where to save the generated image.
-        reference_images: Optional list of reference images.
+        reference_images: Optional list of loaded reference images.
         aspect_ratio: Aspect ratio for the image.
+        cached_content: Optional name of cached content to prepend.
+        verbose: Also request and print the model's text response.
 
     Returns:
         True if image was saved successfully, False otherwise.
     """
-    client = genai.Client(
-        api_key=os.environ.get("GOOGLE_AI_API_KEY"),
+    contents, config = _build_generate_request(
+        prompt, reference_images, aspect_ratio, cached_content, verbose,
     )
+    chunks = _generate_content(client, contents, config)
+    return _save_stream(chunks, output_path)
 
-    if reference_images:
-        contents: list = [prompt]
-        for ref_path in reference_images[:14]:
-            if ref_path.exists():
-                contents.append(Image.open(ref_path))
-            else:
-                print(f"Warning: Reference image not found: {ref_path}")
-
-        response = client.models.generate_content(
-            model="gemini-3-pro-image-preview",
-            contents=contents,
-            config=types.GenerateContentConfig(
-                response_modalities=["IMAGE", "TEXT"],
-            ),
-        )
 
-        if (response.candidates
-                and response.candidates[0].content
-                and response.candidates[0].content.parts):
-            for part in response.candidates[0].content.parts:
-                if part.inline_data and part.inline_data.data:
-                    with open(output_path, "wb") as f:
-                        f.write(part.inline_data.data)
-                    print(f"Image saved to: {output_path}")
-                    return True
-                if hasattr(part, "text") and part.text:
-                    print(part.text)
-    else:
-        contents = [
-            types.Content(
-                role="user",
-                parts=[types.Part.from_text(text=prompt)],
-            ),
-        ]
+async def _afetch_image(
+    client: genai.Client,
+    prompt: str,
+    reference_images: Optional[list[types.Part]] = None,
+    aspect_ratio: str = "16:9",
+    cached_content: Optional[str] = None,
+    verbose: bool = False,
+) -> Optional[bytes]:
+    """Async version of generate_image that returns the image bytes.
 
-        config = types.GenerateContentConfig(
-            response_modalities=["IMAGE", "TEXT"],
-            image_config=types.ImageConfig(
-                aspect_ratio=aspect_ratio,
-                image_size="1K",
-            ),
-        )
+    Saving is left to the caller so the write can overlap the next
+    request instead of holding up the batch.
 
-        for chunk in client.models.generate_content_stream(
-            model="gemini-3-pro-image-preview",
-            contents=contents,
-            config=config,
-        ):
-            if (chunk.candidates is None
-                    or chunk.candidates[0].content is None
-                    or chunk.candidates[0].content.parts is None):
-                continue
+    Args:
+        client: Shared Gemini API client.
+        prompt: Text description of the image to generate.
+        reference_images: Optional list of loaded reference images.
+        aspect_ratio: Aspect ratio for the image.
+        cached_content: Optional name of cached content to prepend.
+        verbose: Also request and print the model's text response.
 
-            part = chunk.candidates[0].content.parts[0]
-            if part.inline_data and part.inline_data.data:
-                with open(output_path, "wb") as f:
-                    f.write(part.inline_data.data)
-                print(f"Image saved to: {output_path}")
-                return True
-            if hasattr(part, "text") and part.text:
-                print(part.text)
+    Returns:
+        The encoded image bytes, or None if no image was returned.
+    """
+    contents, config = _build_generate_request(
+        prompt, reference_images, aspect_ratio, cached_content, verbose,
+    )
+    data = None
+    # Drain the stream so its connection is returned to the pool
+    stream = await _agenerate_content(client, contents, config)
+    async with aclosing(stream) as chunks:
+        async for chunk in chunks:
+            if data is None:
+                data = _first_image_data(chunk)
+    return data
+
+
+def numbered_output_path(output_path: Path, index: int) -> Path:
+    """Return the output path for the index-th image of a batch."""
+    return output_path.with_name(
+        f"{output_path.stem}_{index}{output_path.suffix}"
+    )
+
+
+async def _run_batch(
+    clients: list[genai.Client],
+    prompts: dict[int, str],
+    output_path: Path,
+    reference_images: Optional[list[types.Part]],
+    aspect_ratio: str,
+    concurrency: int,
+    cached_content: Optional[str] = None,
+    verbose: bool = False,
+) -> list[int]:
+    """Generate numbered images for several prompts concurrently.
+
+    Prompts are spread round-robin across the clients, so each API key's
+    rate limit only sees its share of the batch.
+
+    Args:
+        clients: Gemini API clients, one per API key.
+        prompts: Prompts to generate by 1-based image number.
+        output_path: Base output path; images are saved as stem_N.suffix.
+        reference_images: Optional list of loaded reference images.
+        aspect_ratio: Aspect ratio for the images.
+        concurrency: Max requests in flight at once.
+        cached_content: Optional name of cached content to prepend.
+        verbose: Also request and print the model's text responses.
 
-    return False
+    Returns:
+        1-based indices of the prompts that failed.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(client: genai.Client, i: int, prompt: str) -> bool:
+        path = numbered_output_path(output_path, i)
+        try:
+            async with semaphore:
+                data = await _afetch_image(
+                    client,
+                    prompt,
+                    reference_images=reference_images,
+                    aspect_ratio=aspect_ratio,
+                    cached_content=cached_content,
+                    verbose=verbose,
+                )
+            # Save outside the semaphore and off the event loop, so the
+            # next request is already in flight while this image is written
+            if data is None:
+                return False
+            if not await asyncio.to_thread(_save_image_bytes, data, path):
+                return False
+        except Exception as e:
+            print(f"Error generating image {i}: {e}")
+            return False
+        print(f"Image saved to: {path}")
+        return True
+
+    indices = list(prompts)
+    results = await asyncio.gather(*[
+        bounded(clients[n % len(clients)], i, prompts[i])
+        for n, i in enumerate(indices)
+    ])
+    return [i for i, ok in zip(indices, results) if not ok]
 
 
 def main() -> int:
@@ -293,6 +1018,22 @@ Examples:
         choices=["1:1", "3:4", "4:3", "4:5", "5:4", "9:16", "16:9", "21:9"],
         help="Aspect ratio (default: 16:9)",
     )
+    parser.add_argument(
+        "--concurrency", "-c",
+        type=int,
+        default=4,
+        help="Max parallel generations for multiple prompts (default: 4)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the API and don't read or write the image cache",
+    )
+    parser.add_argument(
+        "--verbose", "-v",
+        action="store_true",
+        help="Also request and print the model's text response",
+    )
     args = parser.parse_args()
 
     # Load .env from script directory first, then current directory
@@ -302,12 +1043,22 @@ Examples:
         load_dotenv(env_path)
     load_dotenv()  # Also try current directory
 
-    if not os.environ.get("GOOGLE_AI_API_KEY"):
+    api_keys = get_api_keys()
+    if not api_keys:
         print("Error: GOOGLE_AI_API_KEY not found in environment")
         print("Create a .env file with: GOOGLE_AI_API_KEY=your_key_here")
         print("Get your API key from: https://aistudio.google.com/apikey")
         return 1
 
+    import httpx
+    from google.genai import errors
+
+    # One client per key for the whole run so every request reuses its
+    # connection pool; single requests use the first
+    per_client = -(-args.concurrency // len(api_keys))
+    clients = [create_client(key, per_client) for key in api_keys]
+    client = clients[0]
+
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
@@ -333,35 +1084,115 @@ Examples:
     if style_template:
         prompts = [apply_style_template(style_template, p) for p in prompts]
 
-    ref_images = [Path(r) for r in args.references] if args.references else None
+    # Read references once up front instead of once per prompt
+    ref_images = (
+        load_reference_images([Path(r) for r in args.references])
+        if args.references else None
+    )
+
+    # Cache keys (and the hashing behind them) are skipped with --no-cache
+    use_cache = not args.no_cache
+    refs_digest = images_digest(ref_images) if use_cache else b""
+    cache_key = None
 
     if args.edit:
         input_path = Path(args.edit)
         if not input_path.exists():
             print(f"Error: Input image not found: {input_path}")
             return 1
-        edit_image(input_path, prompts[0], output_path, reference_images=ref_images)
+        if use_cache:
+            cache_key = output_cache_key(
+                prompts[0],
+                args.aspect,
+                refs_digest,
+                input_image=image_part(input_path),
+            )
+            if load_cached_output(cache_key, output_path):
+                return 0
+        if edit_image(
+            client,
+            input_path,
+            prompts[0],
+            output_path,
+            reference_images=ref_images,
+            verbose=args.verbose,
+        ) and cache_key:
+            store_cached_output(cache_key, output_path)
     elif len(prompts) == 1:
-        generate_image(
+        if use_cache:
+            cache_key = output_cache_key(prompts[0], args.aspect, refs_digest)
+            if load_cached_output(cache_key, output_path):
+                return 0
+        if generate_image(
+            client,
             prompts[0],
             output_path,
             reference_images=ref_images,
             aspect_ratio=args.aspect,
-        )
+            verbose=args.verbose,
+        ) and cache_key:
+            store_cached_output(cache_key, output_path)
     else:
-        stem = output_path.stem
-        suffix = output_path.suffix
-        parent = output_path.parent
-
-        for i, prompt in enumerate(prompts, 1):
-            numbered_path = parent / f"{stem}_{i}{suffix}"
-            print(f"\nGenerating image {i}/{len(prompts)}...")
-            generate_image(
-                prompt,
-                numbered_path,
-                reference_images=ref_images,
-                aspect_ratio=args.aspect,
-            )
+        # Skip prompts whose identical request was already generated
+        cache_keys = {
+            i: output_cache_key(p, args.aspect, refs_digest)
+            for i, p in enumerate(prompts, 1)
+        } if use_cache else {}
+        pending = {
+            i: p for i, p in enumerate(prompts, 1)
+            if not (i in cache_keys and load_cached_output(
+                cache_keys[i], numbered_output_path(output_path, i)
+            ))
+        }
+        if not pending:
+            return 0
+
+        print(f"\nGenerating {len(pending)} images "
+              f"({max(1, args.concurrency)} at a time)...")
+        # Upload the shared style prefix once instead of with every prompt.
+        # Only worth it when several requests reuse it, and caches belong
+        # to one key's project, so only with a single key.
+        style_cache = None
+        if style_template and len(pending) > 1 and len(clients) == 1:
+            style_cache = create_style_cache(client, style_template)
+        if style_cache:
+            print(f"Cached style template prefix: {style_cache.name}")
+            pending = {
+                i: apply_cached_style_template(
+                    style_template, args.prompts[i - 1]
+                )
+                for i in pending
+            }
+
+        try:
+            # A single event loop keeps all in-flight requests on one thread
+            failed = asyncio.run(_run_batch(
+                clients,
+                pending,
+                output_path,
+                ref_images,
+                args.aspect,
+                args.concurrency,
+                cached_content=style_cache.name if style_cache else None,
+                verbose=args.verbose,
+            ))
+        finally:
+            if style_cache:
+                try:
+                    client.caches.delete(name=style_cache.name)
+                except (errors.APIError, httpx.TransportError) as e:
+                    # The cache still expires on its own after CACHE_TTL
+                    print(f"Warning: Could not delete style cache ({e})")
+
+        for i in pending:
+            if i in cache_keys and i not in failed:
+                store_cached_output(
+                    cache_keys[i], numbered_output_path(output_path, i)
+                )
+
+        if failed:
+            print(f"\nFailed to generate {len(failed)}/{len(prompts)} images: "
+                  f"{', '.join(str(i) for i in sorted(failed))}")
 
     return 0
 